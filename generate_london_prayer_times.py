@@ -3,13 +3,14 @@
 
 from __future__ import annotations
 
-import json
 import os
-from collections.abc import Iterable
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from pathlib import Path
+from typing import Any
 from zoneinfo import ZoneInfo
 
+import orjson
 import requests
 from requests import Session
 from requests.adapters import HTTPAdapter
@@ -24,6 +25,27 @@ LONDON_TZ = ZoneInfo("Europe/London")
 OUTPUT_PATH = Path(__file__).parent / "data" / "london-prayer-times-7d.json"
 REQUEST_TIMEOUT_SECONDS = (10, 25)
 MAX_NETWORK_ATTEMPTS = 3
+# Bump whenever the shape of the generated feed changes.
+SCHEMA_VERSION = 1
+
+# (output key, API key) pairs in output order. Keep keys explicit/consistent for frontend consumers.
+_DAY_KEY_MAP: tuple[tuple[str, str], ...] = (
+    ("fajr", "fajr"),
+    ("fajr_jamaah", "fajr_jamat"),
+    ("sunrise", "sunrise"),
+    ("dhuhr", "dhuhr"),
+    ("dhuhr_jamaah", "dhuhr_jamat"),
+    ("asr", "asr"),
+    ("asr_hanafi", "asr_2"),
+    ("asr_jamaah", "asr_jamat"),
+    ("maghrib", "magrib"),
+    ("maghrib_jamaah", "magrib_jamat"),
+    ("isha", "isha"),
+    ("isha_jamaah", "isha_jamat"),
+)
+
+# Years already resolved in this process, keyed on (year, api_key).
+_YEAR_CACHE: dict[tuple[int, str], dict[str, dict[str, str]]] = {}
 
 
 class PrayerGenerationError(RuntimeError):
@@ -39,11 +61,16 @@ def _api_key() -> str:
 
 
 def _build_session() -> Session:
+    # This is the only retry layer: up to MAX_NETWORK_ATTEMPTS requests per URL,
+    # with exponential backoff capped at 8s plus up to 0.5s of jitter.
+    retries = MAX_NETWORK_ATTEMPTS - 1
     retry = Retry(
-        total=3,
-        connect=3,
-        read=3,
-        backoff_factor=1.0,
+        total=retries,
+        connect=retries,
+        read=retries,
+        backoff_factor=0.5,
+        backoff_max=8,
+        backoff_jitter=0.5,
         status_forcelist=(429, 500, 502, 503, 504),
         allowed_methods=frozenset({"GET"}),
         raise_on_status=False,
@@ -64,37 +91,111 @@ def _build_session() -> Session:
     return session
 
 
-def _fetch_month(session: Session, year: int, month: int, api_key: str) -> dict[str, dict[str, str]]:
+def _fetch_year(
+    session: Session, year: int, api_key: str, cached: dict[str, Any] | None = None
+) -> dict[str, Any]:
     params = {
         "format": "json",
         "key": api_key,
         "24hours": "true",
         "year": str(year),
-        "month": str(month),
     }
 
+    # Revalidate a cached year instead of downloading it again.
+    headers: dict[str, str] = {}
+    if cached is not None:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
     last_error: Exception | None = None
 
-    for attempt in range(1, MAX_NETWORK_ATTEMPTS + 1):
-        for api_url in API_URLS:
-            try:
-                response = session.get(api_url, params=params, timeout=REQUEST_TIMEOUT_SECONDS)
-                response.raise_for_status()
+    for api_url in API_URLS:
+        try:
+            response = session.get(
+                api_url, params=params, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS
+            )
+            response.raise_for_status()
+
+            if response.status_code == 304 and cached is not None:
+                return cached
+
+            payload = orjson.loads(response.content)
+            times = payload.get("times")
+
+            if not isinstance(times, dict):
+                raise PrayerGenerationError(
+                    f"API response for {year} does not include a valid 'times' object"
+                )
+
+            return {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "times": times,
+            }
+        except Exception as error:  # noqa: BLE001
+            last_error = error
+            print(f"Request failed for {api_url} ({year}): {error}")
+
+    raise PrayerGenerationError(f"Failed to fetch data for {year}: {last_error}")
+
+
+def _cache_path(year: int) -> Path:
+    return OUTPUT_PATH.parent / ".cache" / f"{year}.json"
+
+
+def _read_cached_year(path: Path) -> dict[str, Any] | None:
+    try:
+        entry = orjson.loads(path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+    if not isinstance(entry, dict) or not isinstance(entry.get("times"), dict):
+        return None
+
+    return entry
 
-                payload = response.json()
-                times = payload.get("times")
 
-                if not isinstance(times, dict):
-                    raise PrayerGenerationError(
-                        f"API response for {year}-{month:02d} does not include a valid 'times' object"
-                    )
+def _write_atomic(path: Path, data: bytes) -> None:
+    # Write a sibling temp file and rename it over the target so readers never
+    # see a partially written file.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
 
-                return times
-            except Exception as error:  # noqa: BLE001
-                last_error = error
-                print(f"Attempt {attempt}/{MAX_NETWORK_ATTEMPTS} failed for {api_url} ({year}-{month:02d}): {error}")
 
-    raise PrayerGenerationError(f"Failed to fetch data for {year}-{month:02d}: {last_error}")
+def _cached_fetch_year(
+    session: Session, year: int, api_key: str, today: date
+) -> tuple[dict[str, dict[str, str]], bool]:
+    """Return the year's times and whether they came from a stale cache copy."""
+    memo_key = (year, api_key)
+    if memo_key in _YEAR_CACHE:
+        return _YEAR_CACHE[memo_key], False
+
+    cache_path = _cache_path(year)
+    cached = _read_cached_year(cache_path)
+
+    # Published timetables for past years do not change, so never refetch them.
+    if cached is not None and year < today.year:
+        _YEAR_CACHE[memo_key] = cached["times"]
+        return cached["times"], False
+
+    try:
+        entry = _fetch_year(session, year, api_key, cached)
+    except PrayerGenerationError as error:
+        if cached is None:
+            raise
+
+        print(f"Using cached timetable for {year}: {error}")
+        return cached["times"], True
+
+    if entry is not cached:
+        _write_atomic(cache_path, orjson.dumps(entry))
+
+    _YEAR_CACHE[memo_key] = entry["times"]
+    return entry["times"], False
 
 
 def _load_existing_days() -> list[dict[str, str]]:
@@ -102,14 +203,22 @@ def _load_existing_days() -> list[dict[str, str]]:
         return []
 
     try:
-        payload = json.loads(OUTPUT_PATH.read_text(encoding="utf-8"))
-    except json.JSONDecodeError:
+        payload = orjson.loads(OUTPUT_PATH.read_bytes())
+    except orjson.JSONDecodeError:
+        return []
+
+    if not isinstance(payload, dict):
         return []
 
     days = payload.get("days")
     if not isinstance(days, list):
         return []
 
+    # A feed stamped with the current schema version was written by this script,
+    # so its days need no per-item validation.
+    if payload.get("schema_version") == SCHEMA_VERSION:
+        return days
+
     result: list[dict[str, str]] = []
     for item in days:
         if isinstance(item, dict) and isinstance(item.get("date"), str):
@@ -118,36 +227,12 @@ def _load_existing_days() -> list[dict[str, str]]:
     return result
 
 
-def _dates_map(days: Iterable[dict[str, str]]) -> dict[str, dict[str, str]]:
-    mapped: dict[str, dict[str, str]] = {}
-    for day in days:
-        date_key = day.get("date")
-        if date_key:
-            mapped[date_key] = day
-
-    return mapped
-
-
 def _normalise_day(date_key: str, raw: dict[str, str]) -> dict[str, str]:
-    # Keep keys explicit/consistent for frontend consumers.
-    return {
-        "date": date_key,
-        "fajr": raw.get("fajr", ""),
-        "fajr_jamaah": raw.get("fajr_jamat", ""),
-        "sunrise": raw.get("sunrise", ""),
-        "dhuhr": raw.get("dhuhr", ""),
-        "dhuhr_jamaah": raw.get("dhuhr_jamat", ""),
-        "asr": raw.get("asr", ""),
-        "asr_hanafi": raw.get("asr_2", ""),
-        "asr_jamaah": raw.get("asr_jamat", ""),
-        "maghrib": raw.get("magrib", ""),
-        "maghrib_jamaah": raw.get("magrib_jamat", ""),
-        "isha": raw.get("isha", ""),
-        "isha_jamaah": raw.get("isha_jamat", ""),
-    }
+    return {"date": date_key, **{out_key: raw.get(source_key, "") for out_key, source_key in _DAY_KEY_MAP}}
 
 
-def main() -> None:
+def main(session: Session | None = None) -> None:
+    """Generate the feed, reusing ``session`` if given (the caller then owns it)."""
     now_london = datetime.now(LONDON_TZ)
     today_london = now_london.date()
     target_dates = [today_london + timedelta(days=offset) for offset in range(7)]
@@ -156,22 +241,36 @@ def main() -> None:
     if not key:
         raise PrayerGenerationError("Missing London Prayer Times API key")
 
-    month_pairs = sorted({(value.year, value.month) for value in target_dates})
+    # One request covers a whole year; the window only needs a second one when it
+    # crosses into January.
+    years = [target_dates[0].year]
+    if target_dates[-1].year != years[0]:
+        years.append(target_dates[-1].year)
+    wanted = frozenset(value.isoformat() for value in target_dates)
     combined_times: dict[str, dict[str, str]] = {}
-    existing_days = _load_existing_days()
-    existing_days_by_date = _dates_map(existing_days)
-    session = _build_session()
+    existing_days_by_date = {day["date"]: day for day in _load_existing_days() if day["date"]}
+    owns_session = session is None
+    if session is None:
+        session = _build_session()
 
     network_failed = False
 
     try:
-        for year, month in month_pairs:
-            combined_times.update(_fetch_month(session, year, month, key))
+        # Year requests are independent, so issue them concurrently and
+        # merge in calendar order once they have all completed.
+        with ThreadPoolExecutor(max_workers=len(years)) as executor:
+            futures = [executor.submit(_cached_fetch_year, session, year, key, today_london) for year in years]
+            for future in futures:
+                times, from_cache = future.result()
+                # Only the window's dates are read, so drop the rest of the year here.
+                combined_times.update((date_key, day) for date_key, day in times.items() if date_key in wanted)
+                network_failed = network_failed or from_cache
     except PrayerGenerationError as error:
         network_failed = True
         print(f"Network fetch failed, attempting stale fallback: {error}")
     finally:
-        session.close()
+        if owns_session:
+            session.close()
 
     days: list[dict[str, str]] = []
     missing_dates: list[str] = []
@@ -196,6 +295,7 @@ def main() -> None:
         raise PrayerGenerationError(f"Missing timetable data for dates: {missing_joined}")
 
     payload = {
+        "schema_version": SCHEMA_VERSION,
         "source": {
             "name": "London Unified Prayer Times API",
             "url": "https://www.londonprayertimes.com/api",
@@ -208,8 +308,7 @@ def main() -> None:
         "days": days,
     }
 
-    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
-    OUTPUT_PATH.write_text(json.dumps(payload, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    _write_atomic(OUTPUT_PATH, orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
     print(f"Wrote {OUTPUT_PATH} ({len(days)} days)")
 
 